@@ -3,6 +3,7 @@
 # pylint: disable=missing-function-docstring
 # pylint: disable=invalid-name
 # pylint: disable=import-error
+import threading
 import time
 from datetime import timedelta
 from unittest import TestCase
@@ -37,6 +38,40 @@ class TestTimedPool(TestCase):
                 self.assertEqual(items[i][1], p[items[i][0]])
             p.stop()
 
+    def test_lru(self):
+        p = TimedPool(max_size=2, strict_bounded=False)
+        p['a'] = 1
+        p['b'] = 2
+        self.assertEqual(p['a'], 1)
+        p['c'] = 3
+
+        self.assertTrue('a' in p)
+        self.assertFalse('b' in p)
+        self.assertTrue('c' in p)
+        self.assertEqual(len(p), 2)
+        p.stop()
+
+    def test_lru_read_while_iterating(self):
+        p = TimedPool(strict_bounded=False, clean_t=0, initial=self.el)
+        for k in p:
+            self.assertEqual(self.el[k], p[k])
+            self.assertEqual(self.el[k], p.get(k))
+        self.assertListEqual(list(p), list(self.el))
+        p.stop()
+
+    def test_lru_after_delete(self):
+        p = TimedPool(max_size=2, strict_bounded=False)
+        p['a'] = 1
+        p['b'] = 2
+        del p['a']
+        p['c'] = 3
+        p['d'] = 4
+
+        self.assertFalse('b' in p)
+        self.assertTrue('c' in p)
+        self.assertTrue('d' in p)
+        p.stop()
+
     def test_init_size_invalid(self):
         p = TimedPool(max_size=-1)
         self.assertEqual(p.max_size, 0)
@@ -47,6 +82,14 @@ class TestTimedPool(TestCase):
         self.assertEqual(p.clean_t, 0)
         p.stop()
 
+    def test_shared_cleaner(self):
+        pools = [TimedPool() for _ in range(10)]
+        before = threading.active_count()
+        pools += [TimedPool() for _ in range(10)]
+        self.assertEqual(threading.active_count(), before)
+        for p in pools:
+            p.stop()
+
     def test_deletion(self):
         p = TimedPool(ttl=timedelta(seconds=1), clean_t=1)
         p['key'] = 'value'
@@ -57,6 +100,56 @@ class TestTimedPool(TestCase):
         self.assertFalse('key' in p)
         p.stop()
 
+    def test_expired_lookup(self):
+        p = TimedPool(ttl=timedelta(seconds=1))
+        p['key'] = 'value'
+
+        time.sleep(1.5)
+
+        self.assertFalse('key' in p)
+        self.assertIsNone(p.get('key'))
+        with self.assertRaises(KeyError):
+            _ = p['key']
+        p.stop()
+
+    def test_no_cleaner(self):
+        p = TimedPool(max_size=1, ttl=timedelta(seconds=1), clean_t=0)
+        p['key'] = 'value'
+
+        time.sleep(1.5)
+
+        self.assertEqual(len(p), 1)
+        p['other'] = 'value'
+        self.assertFalse('key' in p)
+        self.assertEqual(p['other'], 'value')
+        p.stop()
+
+    def test_expired_removal(self):
+        p = TimedPool(ttl=timedelta(seconds=0.2), clean_t=0)
+        p['a'] = 'x'
+        p['b'] = 'y'
+        time.sleep(0.3)
+        p.set('c', 'z', timedelta(minutes=1))
+
+        with self.assertRaises(KeyError):
+            del p['a']
+        self.assertEqual(p.popitem(), ('c', 'z'))
+        with self.assertRaises(KeyError):
+            p.popitem()
+        p.stop()
+
+    def test_deletion_mixed_ttl(self):
+        p = TimedPool(ttl=timedelta(hours=1), clean_t=1)
+        p['long'] = 'value'
+        p.set('short', 'value', timedelta(seconds=1))
+        p.set('long', 'value')
+
+        time.sleep(3)
+
+        self.assertFalse('short' in p)
+        self.assertTrue('long' in p)
+        p.stop()
+
 
 class TestTimedPoolCompat(TestCase):
     def setUp(self) -> None:
@@ -156,6 +249,25 @@ class TestTimedPoolCompat(TestCase):
             self.assertEqual(p[key], 7)
         p.stop()
 
+    def test_getitem_missing(self):
+        with self.assertRaises(KeyError):
+            _ = self.p['Not']
+
+    def test_set_many(self):
+        p = TimedPool()
+        p.set_many(self.el.items(), timedelta(minutes=1))
+        self.assertListEqual(list(p), list(self.el))
+        for k, v in self.el.items():
+            self.assertEqual(v, p[k])
+        p.stop()
+
+    def test_set_many_full(self):
+        p = TimedPool(max_size=2)
+        with self.assertRaises(FullException):
+            p.set_many(self.el)
+        self.assertListEqual(list(p), list(self.el)[:2])
+        p.stop()
+
     def test_get(self):
         k, v = list(self.el.items())[0]
         self.assertEqual(self.p.get(k), v)
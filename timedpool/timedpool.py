@@ -2,15 +2,28 @@
 
 Adapted from https://stackoverflow.com/a/3927345/6571785
 """
+import heapq
+import itertools
 import logging
+import math
 import threading
-from datetime import datetime, timedelta
+import time
+import weakref
+from collections import OrderedDict
+from datetime import timedelta
 from typing import Iterable, Tuple, TypeVar, Union
 
 _KT = TypeVar("_KT")
 _VT = TypeVar("_VT")
 Initial = Union[Iterable[Tuple[_KT, _VT]], dict[_KT, _VT]]
 
+_LOG = logging.getLogger(__name__)
+
+
+def _to_ns(duration: timedelta) -> int:
+    """Converts a duration to whole nanoseconds, without rounding errors."""
+    return duration // timedelta(microseconds=1) * 1000
+
 
 class TimedPool(dict[_KT, _VT]):
     """A dict with a maximum size whose elements are deleted after a delay.
@@ -27,8 +40,13 @@ class TimedPool(dict[_KT, _VT]):
 
     The difference with a normal dictionary is that this can contain a maximum
     number of objects, after which insertions will raise a `FullException`.
+    If `strict_bounded` is False, insertions into a full pool evict the least
+    recently used item instead, and reading an item marks it as recently used.
+    Recency is tracked apart from the items: iteration order is still the
+    insertion order, and reading items while iterating is allowed.
     Furthermore, each item can be removed after a certain amount of time (ttl).
-    Items are not removed immediately, but at fixed intervals.
+    Items are not removed immediately, but at most `clean_t` seconds after
+    they expire; in the meantime, lookups treat expired items as missing.
 
     Using `p[key] = value` will apply the default ttl; instead,
     `p.set(ket, value, ttl)` allows to set a specific ttl.
@@ -36,7 +54,8 @@ class TimedPool(dict[_KT, _VT]):
     The `stop()` method can be used to stop the cleaning routine.
 
     Both `max_size` and `clean_t` must be greater or equal to 0, negative
-    values are rounded to 0.
+    values are rounded to 0. If `clean_t` is 0 there is no cleaning routine:
+    expired items are removed only when inserting into a full pool.
 
     The `initial` parameter can be an iterable of tuples that is used to
     populate the pool with some elements.
@@ -46,107 +65,229 @@ class TimedPool(dict[_KT, _VT]):
 
     :ivar max_size: the maximum number of items in this
     :ivar ttl: a duration after which an item can be removed from this dict
-    :ivar clean_t: seconds between runs of the cleaning routine
+    :ivar clean_t: maximum seconds between runs of the cleaning routine
+    :ivar strict_bounded: whether a full pool raises instead of evicting
     :param initial: the initial values of this dict
     """
 
+    __slots__ = ('max_size', 'clean_t', '_ttl', '_ttl_ns', '_lock', '_heap',
+                 '_counter', '_recency', '_running', '__weakref__')
+
     def __init__(self,
                  max_size: int = 10,
                  ttl: timedelta = timedelta(hours=1),
                  clean_t: int = 120,
-                 initial: Initial = None):
+                 initial: Initial = None,
+                 strict_bounded: bool = True):
         super().__init__()
         self.max_size = max_size if max_size >= 0 else 0
         self.ttl = ttl
         self.clean_t = clean_t if clean_t >= 0 else 0
 
-        self._cv = threading.Condition()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = itertools.count()
+        self._recency = None if strict_bounded else OrderedDict()
         self._running = False
-        self._thread = None
         self.start()
 
         if initial is not None:
-            if isinstance(initial, dict):
-                initial = initial.items()
-            for k, v in initial:
-                self.set(k, v)
-
-    def _cleaner(self):
-        """Removes expired items from this at regular intervals."""
-        while self._running:
-            with self._cv:
-                now = datetime.now()
-                deleting = [k for k, v in super().items()
-                            if v['expireTime'] < now]
-                for key in deleting:
-                    super().__delitem__(key)
-                if deleting:
-                    logging.getLogger(__name__).debug(
-                        "entries expired: %s", len(deleting))
-                self._cv.wait(self.clean_t)
+            self.set_many(initial)
+
+    @property
+    def ttl(self) -> timedelta:
+        """The default duration after which an item can be removed."""
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, ttl: timedelta) -> None:
+        self._ttl = ttl
+        self._ttl_ns = _to_ns(ttl)
+
+    @property
+    def strict_bounded(self) -> bool:
+        """Whether a full pool raises instead of evicting."""
+        return self._recency is None
+
+    def _sweep(self) -> float:
+        """Removes expired items from this.
+
+        :return: seconds until this should be swept again
+        """
+        if self._next_expiry() > time.monotonic_ns():
+            return self._next_delay()
+        with self._lock:
+            expired = self._expire()
+            if expired and _LOG.isEnabledFor(logging.DEBUG):
+                _LOG.debug("entries expired: %s", expired)
+            return self._next_delay()
+
+    def _expire(self) -> int:
+        """Removes expired items, must be called holding the lock.
+
+        Expiration times are kept in a heap, so this only looks at the items
+        that are actually expired. Heap entries whose key has been removed or
+        refreshed are skipped.
+
+        :return: the number of removed items
+        """
+        heap = self._heap
+        heappop = heapq.heappop
+        get = super().get
+        pop = super().pop
+        now = time.monotonic_ns()
+        expired = 0
+        while heap and heap[0][0] <= now:
+            _, _, key = heappop(heap)
+            entry = get(key)
+            if entry is not None and entry[0] <= now \
+                    and pop(key, None) is not None:
+                expired += 1
+        return expired
+
+    def _next_expiry(self) -> float:
+        """Returns the earliest expiration time in the heap, in nanoseconds."""
+        try:
+            return self._heap[0][0]
+        except IndexError:
+            return math.inf
+
+    def _next_delay(self) -> float:
+        """Returns seconds until the next sweep is due."""
+        return min(self.clean_t,
+                   (self._next_expiry() - time.monotonic_ns()) / 1e9)
+
+    def _touch(self, key):
+        """Marks an item as the most recently used one, if evicting."""
+        if self._recency is not None:
+            try:
+                self._recency.move_to_end(key)
+            except KeyError:
+                pass  # dropped by a concurrent compaction
+
+    def _evict(self):
+        """Removes the least recently used item, must hold the lock.
+
+        Keys removed from this without the lock are still in the recency
+        order, so they are skipped.
+        """
+        recency = self._recency
+        while recency:
+            key, _ = recency.popitem(last=False)
+            if super().pop(key, None) is not None:
+                return
+
+    def _compact_recency(self):
+        """Drops the keys no longer in this from the recency order."""
+        keys = list(self._recency)
+        self._recency = OrderedDict.fromkeys(
+            k for k in keys if super().__contains__(k))
+
+    def _compact_heap(self):
+        """Rebuilds the heap from the live items, dropping stale entries."""
+        self._heap = [(exp, next(self._counter), key)
+                      for key, (exp, _) in super().items()]
+        heapq.heapify(self._heap)
 
     def start(self):
-        """Start the cleaning routine in a new thread."""
-        if self._running:
+        """Starts the cleaning routine on the shared cleaner thread.
+
+        This does nothing if `clean_t` is 0.
+        """
+        if self._running or not self.clean_t:
             return
         self._running = True
-        self._thread = threading.Thread(target=self._cleaner)
-        self._thread.start()
+        _CleanerService.get().register(self)
 
     def stop(self):
-        """Stops the cleaning routine and allows the thread to terminate."""
+        """Stops the cleaning routine for this."""
         if not self._running:
             return
-        with self._cv:
-            self._running = False
-            self._cv.notify_all()
-        self._thread.join()
+        self._running = False
+        _CleanerService.get().unregister(self)
 
     def set(self, key, val, ttl=None):
         """Adds a key-value pair to this.
 
         If `ttl` is not provided, the default duration is taken from the
         constructor.
-        If this is full, this raises a `FullException`.
+        If this is full, this raises a `FullException`, unless
+        `strict_bounded` is False, in which case the least recently used item
+        is evicted.
         """
-        if ttl is None:
-            ttl = self.ttl
-
-        if len(self) >= self.max_size and not key in self:
-            raise FullException()
-
-        with self._cv:
-            super().__setitem__(key, {
-                'data': val,
-                'expireTime': datetime.now() + ttl,
-            })
+        ttl_ns = self._ttl_ns if ttl is None else _to_ns(ttl)
+        expire = time.monotonic_ns() + ttl_ns
+        with self._lock:
+            self._insert(key, val, expire)
+
+    def set_many(self, items: Initial, ttl=None):
+        """Adds several key-value pairs to this, in order.
+
+        This is equivalent to calling `set` for each pair, but the expiration
+        time is computed and the lock is taken only once. As for the `initial`
+        parameter, `items` can be an iterable of tuples or a dictionary.
+        If this becomes full, the pairs that fit are added before raising a
+        `FullException`.
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        items = list(items)
+        ttl_ns = self._ttl_ns if ttl is None else _to_ns(ttl)
+        expire = time.monotonic_ns() + ttl_ns
+        with self._lock:
+            for key, val in items:
+                self._insert(key, val, expire)
+
+    def _insert(self, key, val, expire: int):
+        """Stores an item, must be called holding the lock."""
+        if len(self) >= self.max_size and not super().__contains__(key):
+            self._expire()
+            if len(self) >= self.max_size:
+                if self._recency is None or not self:
+                    raise FullException()
+                self._evict()
+        super().__setitem__(key, (expire, val))
+        heapq.heappush(self._heap, (expire, next(self._counter), key))
+        if len(self._heap) > 2 * len(self) + 8:
+            self._compact_heap()
+        if self._recency is not None:
+            self._recency[key] = None
+            self._recency.move_to_end(key)
+            if len(self._recency) > 2 * len(self) + 8:
+                self._compact_recency()
 
     def get(self, key, default=None) -> _VT:
-        if key in self:
-            return super().get(key)['data']
-        return default
+        entry = super().get(key)
+        if entry is None or entry[0] < time.monotonic_ns():
+            return default
+        self._touch(key)
+        return entry[1]
 
     def clear(self) -> None:
-        with self._cv:
+        with self._lock:
             super().clear()
+            self._heap.clear()
+            if self._recency is not None:
+                self._recency.clear()
 
     def copy(self) -> dict[_KT, _VT]:
         # TODO: implement copy & test
         raise NotImplementedError()
 
     def pop(self, key, default=None) -> _VT:
-        if key in self:
-            val = self[key]
-            del self[key]
-            return val
+        entry = super().pop(key, None)
+        if entry is not None and entry[0] >= time.monotonic_ns():
+            return entry[1]
         if default is not None:
             return default
         raise KeyError()
 
     def popitem(self) -> tuple[_KT, _VT]:
-        with self._cv:
-            item = super().popitem()
-        return (item[0], item[1]['data'])
+        now = time.monotonic_ns()
+        while True:
+            key, (exp, val) = super().popitem()
+            if exp >= now:
+                return (key, val)
 
     def setdefault(self, key: _KT, default: _VT) -> _VT:
         # TODO: implement setdefault & test
@@ -165,14 +306,23 @@ class TimedPool(dict[_KT, _VT]):
         raise NotImplementedError()
 
     def __getitem__(self, key: _KT) -> _VT:
-        return self.get(key)
+        exp, val = super().__getitem__(key)
+        if exp < time.monotonic_ns():
+            raise KeyError(key)
+        self._touch(key)
+        return val
+
+    def __contains__(self, key: object) -> bool:
+        entry = super().get(key)
+        return entry is not None and entry[0] >= time.monotonic_ns()
 
     def __setitem__(self, key: _KT, val: _VT) -> None:
         return self.set(key, val)
 
     def __delitem__(self, key) -> None:
-        with self._cv:
-            super().__delitem__(key)
+        exp, _ = super().pop(key)
+        if exp < time.monotonic_ns():
+            raise KeyError(key)
 
     def __del__(self) -> None:
         self.stop()
@@ -185,5 +335,60 @@ class TimedPool(dict[_KT, _VT]):
         return pool
 
 
+class _CleanerService:
+    """Runs the cleaning routine of every started `TimedPool` on one thread.
+
+    Pools are held through weak references, so a pool that is no longer
+    used can be garbage collected even if it was never stopped. Pools are
+    dicts and thus unhashable, so they are keyed by `id()`.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._cv = threading.Condition()
+        self._pools = weakref.WeakValueDictionary()
+        self._woken = False
+        self._thread = threading.Thread(
+            target=self._run, name='TimedPool-cleaner', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls) -> '_CleanerService':
+        """Returns the service, starting it on first use."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def register(self, pool: TimedPool) -> None:
+        """Adds a pool to the ones that are swept."""
+        with self._cv:
+            self._pools[id(pool)] = pool
+            self._woken = True
+            self._cv.notify()
+
+    def unregister(self, pool: TimedPool) -> None:
+        """Removes a pool from the ones that are swept."""
+        with self._cv:
+            self._pools.pop(id(pool), None)
+
+    def _sweep_all(self):
+        """Sweeps every pool, returns seconds until the next sweep is due."""
+        with self._cv:
+            pools = list(self._pools.values())
+        delays = [pool._sweep() for pool in pools]  # pylint: disable=protected-access
+        return min(delays, default=None)
+
+    def _run(self):
+        while True:
+            delay = self._sweep_all()
+            with self._cv:
+                if not self._woken:
+                    self._cv.wait(delay)
+                self._woken = False
+
+
 class FullException(Exception):
     """Exception signaling that the `TimedPool` is full."""